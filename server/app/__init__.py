@@ -9,6 +9,8 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 
 from config import config
+from .admission import AdmissionController
+from .circuitbreaker import CircuitBreaker
 from .models import CibusElasticSearch
 
 db = SQLAlchemy()
@@ -20,6 +22,8 @@ class CibusCartApp(Flask):
     Custom application class subclassing Flask application. This is to ensure more modularity in
      terms of static files and templates. This way a module will have its own templates and the
       root template folder will be more modularized and easier to manage
+    :ivar admission: admission controller limiting requests to the search backend
+    :ivar breaker: circuit breaker rejecting searches while the search backend is failing
     """
 
     def __init__(self):
@@ -33,6 +37,8 @@ class CibusCartApp(Flask):
             self.jinja_loader,
             jinja2.PrefixLoader({}, delimiter=".")
         ])
+        self.admission = None
+        self.breaker = None
 
     def create_global_jinja_loader(self):
         """
@@ -70,6 +76,7 @@ def create_app(config_name):
     # mail.init_app(app)
 
     error_handlers(app)
+    admission_control(app)
     register_app_blueprints(app)
     app_request_handlers(app)
     app_logger_handler(app)
@@ -94,6 +101,18 @@ def app_request_handlers(app):
         cibus_search.check_and_load_index()
 
 
+def admission_control(app):
+    """
+    Sets up admission control for the application, rate limiting clients, capping the
+    calls in flight to elasticsearch and breaking the circuit while it is failing. Blueprints
+    use app.admission and app.breaker to check their requests
+    :param app: the current flask app
+    """
+    app.admission = AdmissionController.from_config(app.config)
+    cibus_search = CibusElasticSearch(timeout=app.config["SEARCH_TIMEOUT"])
+    app.breaker = CircuitBreaker.from_config(app.config, probe=cibus_search.ping)
+
+
 def app_logger_handler(app):
     """
     Will handle error logging for the application and will store the app log files
@@ -0,0 +1,171 @@
+"""
+Admission control for the application. This limits how many requests each client can make and
+how many calls can be in flight to the search backend at once, shedding load early when the
+backend is slow instead of letting requests pile up behind it
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class BackendOverloaded(Exception):
+    """
+    Raised when a backend call is rejected, either because the backend is shedding load or
+    because no slot was freed before the queue deadline
+    """
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter. Tokens are refilled continuously at rate per second up to
+    capacity, each request consumes one or more tokens
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated_at = time.time()
+
+    def consume(self, tokens=1):
+        """
+        Takes tokens from the bucket
+        :param tokens: number of tokens needed
+        :return: True if there were enough tokens, False if the request should be rejected
+        :rtype: bool
+        """
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+    def retry_after(self, tokens=1):
+        """
+        :return: number of seconds until the given number of tokens is available
+        :rtype: float
+        """
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+
+class AdmissionController(object):
+    """
+    Per client rate limiting and backend concurrency control.
+    Clients are identified by their ip address, or by their api key when it is one of
+    api_keys. Each client gets its own token bucket, the least recently seen clients are
+    dropped once max_clients is reached. Backend calls go through backend_slot which caps the
+    number of calls in flight. The latency of a call is tracked per query it runs. The cap is lowered in proportion to the observed backend latency once it
+    exceeds latency_target and while it is above target calls are shed right away instead of
+    waiting for a slot.
+    """
+
+    def __init__(self, rate, burst, max_in_flight, queue_timeout, latency_target,
+                 api_keys=(), max_clients=10000, latency_decay=0.2):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self.latency_target = latency_target
+        self.api_keys = set(api_keys)
+        self.max_clients = max_clients
+        self.latency_decay = latency_decay
+        self.latency = 0.0
+        self.in_flight = 0
+        self._buckets = OrderedDict()
+        self._buckets_lock = threading.Lock()
+        self._slots = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates a controller from the application configuration
+        :param config: flask config object
+        :rtype: AdmissionController
+        """
+        return cls(rate=config["SEARCH_RATE_LIMIT"],
+                   burst=config["SEARCH_RATE_BURST"],
+                   max_in_flight=config["SEARCH_MAX_IN_FLIGHT"],
+                   queue_timeout=config["SEARCH_QUEUE_TIMEOUT"],
+                   latency_target=config["SEARCH_LATENCY_TARGET"],
+                   api_keys=config["SEARCH_API_KEYS"])
+
+    def identify(self, address, api_key=None):
+        """
+        Identifies the client making a request. Unknown api keys are ignored, otherwise a
+        client could get a fresh bucket on every request by sending a new key
+        :param address: ip address of the client
+        :param api_key: api key sent by the client, if any
+        :return: client identifier used for rate limiting
+        :rtype: str
+        """
+        if api_key and api_key in self.api_keys:
+            return "key:" + api_key
+        return "ip:{}".format(address)
+
+    def allow(self, client, cost=1):
+        """
+        Checks whether a client may make a request
+        :param client: client identifier from identify
+        :param cost: number of tokens the request consumes, capped at the burst size
+        :return: None if the request is allowed, otherwise seconds until it can be retried
+        """
+        cost = min(cost, self.burst)
+        with self._buckets_lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+            if bucket.consume(cost):
+                return None
+            return bucket.retry_after(cost)
+
+    @property
+    def shedding(self):
+        """
+        :return: whether the backend latency is above target
+        :rtype: bool
+        """
+        return self.latency > self.latency_target
+
+    @property
+    def limit(self):
+        """
+        :return: current cap on backend calls in flight
+        :rtype: int
+        """
+        if not self.shedding:
+            return self.max_in_flight
+        return max(1, int(self.max_in_flight * self.latency_target / self.latency))
+
+    @contextmanager
+    def backend_slot(self, size=1):
+        """
+        Context manager wrapping a backend call. Waits at most queue_timeout for a free slot,
+        or not at all while shedding, and records how long the call took per query
+        :param size: number of queries run by the call, a multi search counts all of them
+        :raises BackendOverloaded: if no slot is available
+        """
+        deadline = time.time() + (0 if self.shedding else self.queue_timeout)
+        with self._slots:
+            while self.in_flight >= self.limit:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise BackendOverloaded()
+                self._slots.wait(remaining)
+            self.in_flight += 1
+
+        started = time.time()
+        try:
+            yield
+        finally:
+            elapsed = (time.time() - started) / max(1, size)
+            with self._slots:
+                self.in_flight -= 1
+                self.latency += self.latency_decay * (elapsed - self.latency)
+                self._slots.notify()
@@ -0,0 +1,124 @@
+"""
+Circuit breaker for the search backend. Once elasticsearch keeps failing or responding slowly
+the breaker opens and calls are rejected straight away, so requests do not tie up workers
+waiting on timeouts. While open a background thread probes the backend and closes the breaker
+once it responds again
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger("CibusCartLogger")
+
+
+class CircuitOpen(Exception):
+    """
+    Raised when a call is rejected because the circuit breaker is open
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Consecutive failure circuit breaker.
+    A call fails when it raises or when it takes longer than latency_threshold seconds for each
+    query it runs. After
+    failure_threshold consecutive failures the breaker opens. Every reset_timeout seconds the
+    breaker goes half open and calls probe in a background thread, a successful probe closes
+    the breaker and a failed one opens it again. Calls are rejected while open or half open.
+    :cvar CLOSED: calls go through
+    :cvar OPEN: calls are rejected
+    :cvar HALF_OPEN: calls are rejected while the backend is being probed
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, latency_threshold, reset_timeout, probe):
+        """
+        :param failure_threshold: consecutive failures needed to open the breaker
+        :param latency_threshold: seconds after which a successful call counts as a failure
+        :param reset_timeout: seconds to wait before probing an open breaker
+        :param probe: callable returning a truthy value when the backend is healthy
+        """
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        self.state = self.CLOSED
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, probe):
+        """
+        Creates a breaker from the application configuration
+        :param config: flask config object
+        :param probe: callable checking the backend health
+        :rtype: CircuitBreaker
+        """
+        return cls(failure_threshold=config["BREAKER_FAILURE_THRESHOLD"],
+                   latency_threshold=config["BREAKER_LATENCY_THRESHOLD"],
+                   reset_timeout=config["BREAKER_RESET_TIMEOUT"],
+                   probe=probe)
+
+    @property
+    def closed(self):
+        """
+        :return: whether calls currently go through
+        :rtype: bool
+        """
+        return self.state == self.CLOSED
+
+    def call(self, func, *args, size=1, **kwargs):
+        """
+        Calls func through the breaker
+        :param size: number of queries run by func, the latency threshold is scaled by it so a
+         large multi search is not mistaken for a slow backend
+        :raises CircuitOpen: if the breaker is not closed
+        :return: whatever func returns
+        """
+        if not self.closed:
+            raise CircuitOpen()
+        started = time.time()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self._record(False)
+            raise
+        self._record(time.time() - started <= self.latency_threshold * max(1, size))
+        return result
+
+    def _record(self, success):
+        with self._lock:
+            if success:
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state != self.CLOSED or self.failures < self.failure_threshold:
+                return
+            self.state = self.OPEN
+        logger.warning("Search backend failing, opening circuit breaker")
+        prober = threading.Thread(target=self._probe_until_healthy, name="breaker-probe")
+        prober.daemon = True
+        prober.start()
+
+    def _probe_until_healthy(self):
+        while True:
+            time.sleep(self.reset_timeout)
+            with self._lock:
+                self.state = self.HALF_OPEN
+            started = time.time()
+            try:
+                healthy = self.probe() and time.time() - started <= self.latency_threshold
+            except Exception:
+                healthy = False
+            with self._lock:
+                if healthy:
+                    self.state = self.CLOSED
+                    self.failures = 0
+                else:
+                    self.state = self.OPEN
+            if healthy:
+                logger.info("Search backend healthy again, closing circuit breaker")
+                return
@@ -0,0 +1,148 @@
+"""
+Precomputed facets for the food truck index. Counts are aggregated once when the index is
+loaded so that facet lookups never have to scan search hits
+"""
+import re
+from collections import Counter, namedtuple
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+FacetSnapshot = namedtuple("FacetSnapshot", ["generation", "categories", "vendors", "cells"])
+
+
+def geohash(latitude, longitude, precision=6):
+    """
+    Encodes a coordinate as a geohash
+    :param latitude: latitude in degrees
+    :param longitude: longitude in degrees
+    :param precision: number of characters in the geohash, 6 gives cells of about 1km
+    :return: geohash of the cell containing the coordinate
+    :rtype: str
+    """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    cell, bits, bit, even = [], 0, 0, True
+    while len(cell) < precision:
+        rng, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value > mid:
+            bits = bits << 1 | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            cell.append(GEOHASH_ALPHABET[bits])
+            bits, bit = 0, 0
+    return "".join(cell)
+
+
+def truck_coordinates(truck):
+    """
+    :param truck: food truck document
+    :return: (latitude, longitude) of the truck or None if it has no usable location
+    """
+    location = truck.get("location")
+    source = location if isinstance(location, dict) else truck
+    try:
+        latitude, longitude = float(source["latitude"]), float(source["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    # unplaced trucks are recorded at 0, 0
+    if not latitude and not longitude:
+        return None
+    return latitude, longitude
+
+
+class FacetIndex(object):
+    """
+    Holds the facets of the current index generation. Each refresh builds a new immutable
+    snapshot of sorted (value, count) tuples and swaps it in, readers always see a complete
+    generation
+    :ivar precision: geohash precision used for the location cells
+    """
+
+    def __init__(self, precision=6):
+        self.precision = precision
+        self.snapshot = FacetSnapshot(0, (), (), ())
+        self._listeners = []
+
+    def subscribe(self, listener):
+        """
+        Registers a function called after every refresh, for anything derived from the
+        previous index generation that has to be dropped
+        :param listener: function taking no arguments
+        """
+        self._listeners.append(listener)
+
+    def refresh(self, trucks, tokenize):
+        """
+        Aggregates the facets of a new index generation
+        :param trucks: iterable of food truck documents
+        :param tokenize: function splitting a fooditems string into categories
+        :return: the new snapshot
+        :rtype: FacetSnapshot
+        """
+        categories, vendors, cells = Counter(), Counter(), Counter()
+        for truck in trucks:
+            categories.update(set(c for c in tokenize(truck.get("fooditems", "")) if c))
+            if "applicant" in truck:
+                vendors[truck["applicant"]] += 1
+            coordinates = truck_coordinates(truck)
+            if coordinates:
+                cells[geohash(coordinates[0], coordinates[1], self.precision)] += 1
+
+        self.snapshot = FacetSnapshot(self.snapshot.generation + 1,
+                                      _most_common(categories),
+                                      _most_common(vendors),
+                                      _most_common(cells))
+        for listener in self._listeners:
+            listener()
+        return self.snapshot
+
+    def summary(self, limit=20):
+        """
+        :param limit: number of values returned for each facet
+        :return: the most common values of each facet
+        :rtype: dict
+        """
+        snapshot = self.snapshot
+        return {
+            "generation": snapshot.generation,
+            "categories": _counts(snapshot.categories[:limit]),
+            "vendors": _counts(snapshot.vendors[:limit]),
+            "cells": _counts(snapshot.cells[:limit])
+        }
+
+    def matching_categories(self, query, limit=10):
+        """
+        Finds the categories matching a search. The query is split into words like the
+        fooditems field is, and categories with a word starting with one of them are returned,
+        so "taco" finds "fish tacos" but "rice" does not find "licorice". Words of one or two
+        letters would match nearly every category and are ignored. Counts are over the whole
+        index, search filters are not applied to them
+        :param query: search term
+        :param limit: maximum number of categories returned
+        :return: the most common categories matching a word of the search term
+        :rtype: dict
+        """
+        snapshot = self.snapshot
+        words = tuple(w for w in re.findall(r"\w+", query.lower()) if len(w) > 2)
+        matches = []
+        if words:
+            matches = [c for c in snapshot.categories
+                       if any(t.startswith(words) for t in re.findall(r"\w+", c[0]))][:limit]
+        return {
+            "generation": snapshot.generation,
+            "categories": _counts(matches)
+        }
+
+
+def _most_common(counter):
+    # ties are ordered by value so every generation built from the same data is identical
+    return tuple(sorted(counter.items(), key=lambda pair: (-pair[1], pair[0])))
+
+
+def _counts(pairs):
+    return [{"name": name, "count": count} for name, count in pairs]
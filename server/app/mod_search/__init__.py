@@ -1,5 +1,18 @@
 from flask import Blueprint
+from .cache import SearchResultCache
+from ..models import facet_index
 
 search_mod = Blueprint(name="search", import_name=__name__, url_prefix="/search")
+result_cache = SearchResultCache()
+# results of the previous index generation no longer agree with the refreshed facets
+facet_index.subscribe(result_cache.clear)
+
+
+@search_mod.record
+def configure_result_cache(state):
+    result_cache.configure(max_size=state.app.config["SEARCH_CACHE_SIZE"],
+                           ttl=state.app.config["SEARCH_CACHE_TTL"],
+                           stale_ttl=state.app.config["SEARCH_CACHE_STALE_TTL"])
+
 
 from . import views
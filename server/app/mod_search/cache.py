@@ -0,0 +1,120 @@
+"""
+In memory cache for search results. Responses are keyed by the normalized query and its
+filters so that repeated searches, from the search bar or from a batch request, do not
+hit Elasticsearch again while they are still fresh
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class SearchResultCache(object):
+    """
+    Thread safe LRU cache with a time to live on each entry.
+    :ivar max_size: maximum number of entries held before the least recently used is evicted
+    :ivar ttl: number of seconds an entry is considered fresh
+    :ivar stale_ttl: number of seconds past its ttl an entry is kept as a last known good value
+    """
+
+    def __init__(self, max_size=512, ttl=300, stale_ttl=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._revalidating = set()
+        self._lock = threading.Lock()
+
+    def configure(self, max_size, ttl, stale_ttl=0):
+        """
+        Reconfigures the cache from the application configuration, dropping any entries that
+        no longer fit
+        :param max_size: maximum number of entries
+        :param ttl: time to live of each entry in seconds
+        :param stale_ttl: seconds an expired entry is kept to be served when it can not be
+         refreshed
+        """
+        with self._lock:
+            self.max_size = max_size
+            self.ttl = ttl
+            self.stale_ttl = stale_ttl
+            self._evict()
+
+    @staticmethod
+    def make_key(query, filters=None):
+        """
+        Builds a cache key from a query and its filters. Queries are case insensitive in the
+        index so they are normalized here as well
+        :param query: search term
+        :param filters: dictionary of field to value filters
+        :return: hashable cache key
+        :rtype: tuple
+        """
+        filters = filters or {}
+        return (query.strip().lower(),
+                tuple(sorted((k, str(v).lower()) for k, v in filters.items())))
+
+    def lookup(self, key):
+        """
+        Fetches an entry from the cache, including an expired one that is still within the
+        stale window so it can be served while it is being revalidated
+        :param key: cache key from make_key
+        :return: tuple of the cached value, or None if there is none, and whether it is fresh
+        :rtype: tuple
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age > self.ttl + self.stale_ttl:
+                del self._entries[key]
+                return None, False
+            self._entries.move_to_end(key)
+            return value, age <= self.ttl
+
+    def begin_revalidate(self, key):
+        """
+        Marks an entry as being revalidated so that only one refresh runs per entry
+        :param key: cache key from make_key
+        :return: False if the entry is already being revalidated
+        :rtype: bool
+        """
+        with self._lock:
+            if key in self._revalidating:
+                return False
+            self._revalidating.add(key)
+            return True
+
+    def end_revalidate(self, key):
+        """
+        Marks the revalidation of an entry as finished, whether it succeeded or not
+        :param key: cache key from make_key
+        """
+        with self._lock:
+            self._revalidating.discard(key)
+
+    def set(self, key, value):
+        """
+        Stores a value in the cache
+        :param key: cache key from make_key
+        :param value: value to store
+        """
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def clear(self):
+        """
+        Drops all the entries, called whenever a new index generation is loaded
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,6 +1,35 @@
-from . import search_mod
-from flask import jsonify, request
-from ..models import CibusElasticSearch, Elasticsearch as es
+import logging
+import threading
+
+from . import search_mod, result_cache
+from flask import current_app, jsonify, request
+from ..admission import BackendOverloaded
+from ..circuitbreaker import CircuitOpen
+from ..models import CibusElasticSearch, facet_index, format_fooditems
+
+logger = logging.getLogger("CibusCartLogger")
+
+
+@search_mod.before_request
+def admit_client():
+    """
+    Rate limits each client, identified by its ip address or a known api key. A client over
+    its limit is still served known queries from the result cache, other requests get a 429.
+    Facets never reach elasticsearch and are not limited, batches are charged by their view
+    for the queries that miss the cache
+    """
+    if request.endpoint in ("search.food_truck_facets", "search.batch_search_for_food_trucks"):
+        return None
+    retry_after = current_app.admission.allow(request_client())
+    if retry_after is None:
+        return None
+    if request.endpoint == "search.search_for_food_trucks" and request.args.get('q'):
+        key = result_cache.make_key(request.args['q'], request_filters())
+        results, fresh = result_cache.lookup(key)
+        if results is not None:
+            return jsonify(dict(results, status="success", stale=not fresh,
+                                facets=facet_index.matching_categories(request.args['q'])))
+    return rejected(429, "Too many requests, please slow down", retry_after)
 
 
 @search_mod.route("")
@@ -11,23 +40,267 @@ def search_for_food_trucks():
             "status": "failure",
             "msg": "Please provide a query"
         })
+    app = current_app._get_current_object()
+    filters = request_filters()
+    cache_key = result_cache.make_key(key, filters)
+    results, fresh = result_cache.lookup(cache_key)
+    if results is not None:
+        if not fresh:
+            revalidate(app, [(cache_key, key, filters)])
+        return jsonify(dict(results, status="success", stale=not fresh,
+                            facets=facet_index.matching_categories(key)))
+
     try:
-        res = es.search(
-            index="cibusdata",
-            body={
-                "query": {"match": {"fooditems": key}},
-                "size": 750  # max document size
-            })
-    except Exception as e:
+        res = backend_call(app, search_backend(app).search, key, filters)
+    except BackendOverloaded:
+        return rejected(503, "Search is overloaded, please retry shortly")
+    except CircuitOpen:
+        return rejected(503, "Search is temporarily unavailable, please retry shortly")
+    except Exception:
         return jsonify({
             "status": "failure",
             "msg": "error in reaching elasticsearch"
         })
+    results = group_vendor_results(res["hits"]["hits"])
+    result_cache.set(cache_key, results)
+
+    return jsonify(dict(results, status="success", stale=False,
+                        facets=facet_index.matching_categories(key)))
+
+
+@search_mod.route("/facets")
+def food_truck_facets():
+    """
+    Returns the precomputed facets of the current index generation: the number of trucks
+    offering each food category, the number of trucks of each vendor and the number of
+    located trucks in each geohash cell
+    """
+    try:
+        limit = int(request.args.get("limit", 20))
+    except ValueError:
+        return jsonify({
+            "status": "failure",
+            "msg": "limit should be a number"
+        })
+    return jsonify(dict(facet_index.summary(limit=max(0, limit)), status="success"))
+
+
+@search_mod.route("/batch", methods=["POST"])
+def batch_search_for_food_trucks():
+    """
+    Searches for several food items in one request. Expects a JSON body of the form
+    {"queries": [{"q": "tacos", "filters": {"status": "APPROVED"}}, ...]}
+    Already known queries are served from the result cache and the rest are sent to
+    elasticsearch in a single multi search. The client is charged one token per query that
+    misses the cache, a rate limited client only gets the cached queries
+    """
+    queries = batch_queries()
+    if not queries:
+        return jsonify({
+            "status": "failure",
+            "msg": "Please provide a list of queries"
+        })
+    max_queries = current_app.config["SEARCH_BATCH_MAX_QUERIES"]
+    if len(queries) > max_queries:
+        return jsonify({
+            "status": "failure",
+            "msg": "A batch can have at most {} queries".format(max_queries)
+        })
+
+    app = current_app._get_current_object()
+    results = []
+    pending = {}
+    stale = []
+    for query in queries:
+        query = query if isinstance(query, dict) else {"q": query}
+        key = query.get("q")
+        filters = query.get("filters") or {}
+        if not isinstance(key, str) or not key.strip() or not isinstance(filters, dict) or \
+                any(f not in CibusElasticSearch.filter_fields for f in filters):
+            results.append({
+                "q": key,
+                "status": "failure",
+                "msg": "Invalid query"
+            })
+            continue
+        cache_key = result_cache.make_key(key, filters)
+        result = {"q": key, "filters": filters,
+                  "facets": facet_index.matching_categories(key)}
+        cached, fresh = result_cache.lookup(cache_key)
+        if cached is not None:
+            result.update(cached, status="success", stale=not fresh)
+            if not fresh:
+                stale.append((cache_key, key, filters))
+        else:
+            pending.setdefault(cache_key, (key, filters, []))[2].append(result)
+        results.append(result)
+    retry_after = None
+    if pending:
+        retry_after = app.admission.allow(request_client(), len(pending))
+    if stale and retry_after is None:
+        revalidate(app, stale)
+
+    unavailable = None
+    status_code = 503
+    if pending:
+        searches = list(pending.values())
+        if retry_after is not None:
+            unavailable = "Too many requests, please slow down"
+            status_code = 429
+            responses = []
+        else:
+            try:
+                responses = backend_call(app, search_backend(app).multi_search,
+                                         [(k, f) for k, f, _ in searches], size=len(searches))
+            except BackendOverloaded:
+                unavailable = "Search is overloaded, please retry shortly"
+            except CircuitOpen:
+                unavailable = "Search is temporarily unavailable, please retry shortly"
+            except Exception as e:
+                logger.warning("Unable to run batch search: {}".format(e))
+                responses = [{"error": "error in reaching elasticsearch"}] * len(searches)
+        if unavailable:
+            responses = [{"error": unavailable}] * len(searches)
+        for cache_key, (key, filters, waiting), res in zip(pending, searches, responses):
+            if "error" in res:
+                msg = unavailable or "error in reaching elasticsearch"
+                outcome = {"status": "failure", "msg": msg}
+            else:
+                grouped = group_vendor_results(res["hits"]["hits"])
+                result_cache.set(cache_key, grouped)
+                outcome = dict(grouped, status="success", stale=False)
+            for result in waiting:
+                result.update(outcome)
+
+    response = jsonify({
+        "results": results,
+        "status": "success"
+    })
+    if unavailable:
+        # cached results are still returned so the client can use them while it backs off
+        response.status_code = status_code
+        response.headers["Retry-After"] = str(max(1, int(round(retry_after or 1))))
+    return response
+
+
+def search_backend(app):
+    """
+    :param app: the current flask app
+    :return: search model using the configured elasticsearch timeout
+    :rtype: CibusElasticSearch
+    """
+    return CibusElasticSearch(timeout=app.config["SEARCH_TIMEOUT"])
+
+
+def backend_call(app, func, *args, size=1):
+    """
+    Calls the search backend through admission control and the circuit breaker. An open
+    breaker is checked before waiting for a slot, and only the call itself is timed by the
+    breaker so time spent queueing for a slot is not mistaken for a slow backend
+    :param app: the current flask app
+    :param func: search function to call
+    :param size: number of queries in the call, latency is tracked per query
+    :raises CircuitOpen: if elasticsearch is failing
+    :raises BackendOverloaded: if there is no capacity for the call
+    :return: whatever func returns
+    """
+    if not app.breaker.closed:
+        raise CircuitOpen()
+    with app.admission.backend_slot(size=size):
+        return app.breaker.call(func, *args, size=size)
+
+
+def revalidate(app, searches):
+    """
+    Refreshes stale cache entries in a background thread while the stale values are served.
+    Nothing is refreshed while the circuit breaker is open, the stale values are kept until
+    elasticsearch is back
+    :param app: the current flask app
+    :param searches: list of (cache_key, key, filters) tuples to refresh
+    """
+    if not app.breaker.closed:
+        return
+    searches = [s for s in searches if result_cache.begin_revalidate(s[0])]
+    if not searches:
+        return
+
+    def refresh():
+        try:
+            responses = backend_call(app, search_backend(app).multi_search,
+                                     [(key, filters) for _, key, filters in searches],
+                                     size=len(searches))
+            for (cache_key, _, _), res in zip(searches, responses):
+                if "error" not in res:
+                    result_cache.set(cache_key, group_vendor_results(res["hits"]["hits"]))
+        except Exception as e:
+            logger.warning("Unable to revalidate cached searches: {}".format(e))
+        finally:
+            for cache_key, _, _ in searches:
+                result_cache.end_revalidate(cache_key)
+
+    worker = threading.Thread(target=refresh, name="search-revalidate")
+    worker.daemon = True
+    worker.start()
+
+
+def batch_queries():
+    """
+    :return: the list of queries in the JSON body of the current request, or None if the body
+     is not a JSON object holding a list of queries
+    :rtype: list
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("queries"), list):
+        return None
+    return payload["queries"]
+
+
+def request_client():
+    """
+    :return: rate limiting identifier of the client making the current request
+    :rtype: str
+    """
+    return current_app.admission.identify(request.remote_addr, request.headers.get("X-Api-Key"))
+
+
+def request_filters():
+    """
+    :return: the filters given in the query string of the current request
+    :rtype: dict
+    """
+    return {f: request.args[f] for f in CibusElasticSearch.filter_fields if f in request.args}
+
+
+def rejected(status_code, msg, retry_after=1):
+    """
+    Builds a fast failure response for a request turned away by admission control
+    :param status_code: 429 when the client is rate limited, 503 when the backend is overloaded
+    :param msg: message for the client
+    :param retry_after: seconds the client should wait before retrying
+    :return: flask response
+    """
+    response = jsonify({
+        "status": "failure",
+        "msg": msg
+    })
+    response.status_code = status_code
+    response.headers["Retry-After"] = str(max(1, int(round(retry_after))))
+    return response
+
+
+def group_vendor_results(hits):
+    """
+    Groups the documents of a search by vendor, each vendor listing the trucks that have a
+    location
+    :param hits: hits of an elasticsearch response
+    :return: dictionary with the vendors, the number of vendors and the number of locations
+    :rtype: dict
+    """
     # filtering results
-    vendors = set([x["_source"]["applicant"] for x in res["hits"]["hits"]])
+    vendors = set([x["_source"]["applicant"] for x in hits])
     temp = {v: [] for v in vendors}
     fooditems = {v: "" for v in vendors}
-    for r in res["hits"]["hits"]:
+    for r in hits:
         applicant = r["_source"]["applicant"]
         if "location" in r["_source"]:
             truck = {
@@ -51,14 +324,8 @@ def search_for_food_trucks():
     hits = len(results["trucks"])
     locations = sum([len(r["branches"]) for r in results["trucks"]])
 
-    return jsonify({
+    return {
         "trucks": results["trucks"],
         "hits": hits,
-        "locations": locations,
-        "status": "success"
-    })
-
-
-def format_fooditems(string):
-    items = [x.strip().lower() for x in string.split(":")]
-    return items[1:] if items[0].find("cold truck") > -1 else items
+        "locations": locations
+    }
@@ -1,14 +1,20 @@
 import sys
 import time
 import requests
-from elasticsearch import exceptions, Elasticsearch
+from elasticsearch import exceptions, helpers, Elasticsearch
 import logging
+from .facets import FacetIndex
 
 es = Elasticsearch(host='es')
+facet_index = FacetIndex()
 
 logger = logging.getLogger("CibusCartLogger")
 
 
+def format_fooditems(string):
+    items = [x.strip().lower() for x in string.split(":")]
+    return items[1:] if items[0].find("cold truck") > -1 else items
+
 
 class CibusFactory(object):
     """
@@ -22,15 +28,38 @@ class CibusFactory(object):
 class CibusElasticSearch(object):
     """
     Elastic search implementation
+    :cvar index: name of the index holding the food truck documents
+    :cvar max_results: maximum number of documents returned for a single query
+    :cvar filter_fields: document fields a search can be filtered on
     """
 
+    index = "cibusdata"
+    max_results = 750
+    filter_fields = ("facilitytype", "status", "applicant")
+
+    def __init__(self, timeout=None):
+        """
+        :param timeout: seconds to wait for elasticsearch to answer a search or a ping, the
+         client default is used if not given
+        """
+        self.timeout = timeout
+
+    def _request_params(self):
+        return {"request_timeout": self.timeout} if self.timeout else {}
+
     def check_and_load_index(self):
         """
-        Check and load the index from elastic search
+        Check and load the index from elastic search, then refresh the facets for this
+        generation of the index
         """
-        if not self.safe_check_index('cibusdata'):
+        if not self.safe_check_index(self.index):
             logger.info("Index not found")
-            self.load_data_in_es()
+            trucks = self.load_data_in_es()
+        else:
+            trucks = [hit["_source"] for hit in helpers.scan(es, index=self.index)]
+        facet_index.refresh(trucks, format_fooditems)
+        logger.info("Facets refreshed for index generation {}".format(
+            facet_index.snapshot.generation))
 
     def safe_check_index(self, index, retry=3):
         """
@@ -54,11 +83,69 @@ class CibusElasticSearch(object):
     def load_data_in_es():
         """
         creates an index in elasticsearch
+        :return: the food truck documents that were loaded
+        :rtype: list
         """
         url = "http://data.sfgov.org/resource/rqzj-sfat.json"
         r = requests.get(url)
         data = r.json()
         logger.info("Loading data in elasticsearch ...")
         for id, truck in enumerate(data):
-            res = es.index(index="cibusdata", doc_type="truck", id=id, body=truck)
+            res = es.index(index=CibusElasticSearch.index, doc_type="truck", id=id, body=truck)
         logger.info("Total trucks loaded: {}".format(len(data)))
+        return data
+
+    @classmethod
+    def build_query(cls, key, filters=None):
+        """
+        Builds the search body for a food item query
+        :param key: food item to search for
+        :param filters: dictionary of field to value filters, restricted to filter_fields
+        :return: Elasticsearch query body
+        :rtype: dict
+        """
+        query = {"match": {"fooditems": key}}
+        if filters:
+            query = {
+                "bool": {
+                    "must": query,
+                    # filter fields are analyzed, a phrase keeps "Tacos El Primo" from
+                    # matching every vendor with one of its words in the name
+                    "filter": [{"match_phrase": {field: value}}
+                               for field, value in filters.items()]
+                }
+            }
+        return {"query": query, "size": cls.max_results}
+
+    def search(self, key, filters=None):
+        """
+        Searches the index for the given food item
+        :param key: food item to search for
+        :param filters: dictionary of field to value filters
+        :return: raw Elasticsearch response
+        :rtype: dict
+        """
+        return es.search(index=self.index, body=self.build_query(key, filters),
+                         **self._request_params())
+
+    def multi_search(self, queries):
+        """
+        Runs several food item searches in a single round trip with the multi search api
+        :param queries: list of (key, filters) tuples
+        :return: list of raw responses in the same order as the queries, failed searches
+         will have an "error" key instead of hits
+        :rtype: list
+        """
+        body = []
+        for key, filters in queries:
+            body.append({"index": self.index})
+            body.append(self.build_query(key, filters))
+        return es.msearch(body=body, **self._request_params())["responses"]
+
+    def ping(self):
+        """
+        Checks whether elasticsearch is reachable
+        :return: True if elasticsearch answered
+        :rtype: bool
+        """
+        return es.ping(**self._request_params())
@@ -31,6 +31,22 @@ class Config(object):
      the data.
     :cvar SQLALCHEMY_DATABASE_URI Define the database - we are working with SQLite for
      this example    
+    :cvar SEARCH_CACHE_SIZE maximum number of search results held in memory
+    :cvar SEARCH_CACHE_TTL number of seconds a cached search result is considered fresh
+    :cvar SEARCH_CACHE_STALE_TTL number of seconds an expired search result is still served
+     while it is refreshed or while elasticsearch is unavailable
+    :cvar SEARCH_BATCH_MAX_QUERIES maximum number of queries accepted by a batch search
+    :cvar SEARCH_RATE_LIMIT search requests per second allowed for each client
+    :cvar SEARCH_RATE_BURST number of search requests a client can make in a burst
+    :cvar SEARCH_API_KEYS api keys rate limited on their own instead of by ip address
+    :cvar SEARCH_MAX_IN_FLIGHT maximum number of concurrent calls to elasticsearch
+    :cvar SEARCH_QUEUE_TIMEOUT seconds a request waits for an elasticsearch slot
+    :cvar SEARCH_LATENCY_TARGET elasticsearch latency in seconds above which load is shed
+    :cvar SEARCH_TIMEOUT seconds to wait for elasticsearch to answer a search
+    :cvar BREAKER_FAILURE_THRESHOLD consecutive failed or slow searches that open the circuit
+     breaker
+    :cvar BREAKER_LATENCY_THRESHOLD search latency in seconds counted as a failure
+    :cvar BREAKER_RESET_TIMEOUT seconds between probes of elasticsearch while the breaker is open
     """
 
     __abstract__ = True
@@ -60,6 +76,22 @@ class Config(object):
     MAIL_PORT = 465
     MAIL_USE_TLS = True
 
+    # search settings
+    SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", 512))
+    SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 300))
+    SEARCH_CACHE_STALE_TTL = int(os.environ.get("SEARCH_CACHE_STALE_TTL", 3600))
+    SEARCH_BATCH_MAX_QUERIES = int(os.environ.get("SEARCH_BATCH_MAX_QUERIES", 50))
+    SEARCH_RATE_LIMIT = float(os.environ.get("SEARCH_RATE_LIMIT", 10))
+    SEARCH_RATE_BURST = int(os.environ.get("SEARCH_RATE_BURST", 50))
+    SEARCH_API_KEYS = [k for k in os.environ.get("SEARCH_API_KEYS", "").split(",") if k]
+    SEARCH_MAX_IN_FLIGHT = int(os.environ.get("SEARCH_MAX_IN_FLIGHT", 16))
+    SEARCH_QUEUE_TIMEOUT = float(os.environ.get("SEARCH_QUEUE_TIMEOUT", 0.5))
+    SEARCH_LATENCY_TARGET = float(os.environ.get("SEARCH_LATENCY_TARGET", 0.5))
+    SEARCH_TIMEOUT = float(os.environ.get("SEARCH_TIMEOUT", 2))
+    BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 5))
+    BREAKER_LATENCY_THRESHOLD = float(os.environ.get("BREAKER_LATENCY_THRESHOLD", 1))
+    BREAKER_RESET_TIMEOUT = float(os.environ.get("BREAKER_RESET_TIMEOUT", 10))
+
     @staticmethod
     def init_app(app):
         """Initializes the current application"""
@@ -85,6 +117,11 @@ class TestingConfig(Config):
     CSRF_ENABLED = False
     PRESERVE_CONTEXT_ON_EXCEPTION = False
 
+    # trip and probe the circuit breaker quickly so tests do not wait on it
+    BREAKER_FAILURE_THRESHOLD = 2
+    BREAKER_LATENCY_THRESHOLD = 0.1
+    BREAKER_RESET_TIMEOUT = 0.05
+
 
 class ProductionConfig(Config):
     """
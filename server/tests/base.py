@@ -0,0 +1,180 @@
+"""
+Base test case for the application. Elasticsearch is replaced by a stub so the tests run
+without a cluster, and faults are injected through the stub
+"""
+import json
+import re
+import time
+import unittest
+from unittest import mock
+
+from elasticsearch import exceptions
+
+from app import create_app, models
+from app.mod_search import result_cache
+
+TRUCKS = [
+    {
+        "applicant": "Tacos El Primo",
+        "fooditems": "Tacos: Burritos: Quesadillas",
+        "facilitytype": "Truck",
+        "status": "APPROVED",
+        "address": "1 Market St",
+        "dayshours": "Mo-Fr:10AM-2PM",
+        "latitude": "37.7936",
+        "longitude": "-122.3950",
+        "location": {"latitude": "37.7936", "longitude": "-122.3950"}
+    },
+    {
+        "applicant": "Tacos El Primo",
+        "fooditems": "Tacos: Burritos: Quesadillas",
+        "facilitytype": "Truck",
+        "status": "REQUESTED",
+        "address": "100 Mission St",
+        "latitude": "37.7915",
+        "longitude": "-122.3961",
+        "location": {"latitude": "37.7915", "longitude": "-122.3961"}
+    },
+    {
+        "applicant": "The Fish Shack",
+        "fooditems": "Cold Truck: Fish Tacos: Soda",
+        "facilitytype": "Truck",
+        "status": "APPROVED",
+        "address": "50 Fremont St",
+        "latitude": "37.7749",
+        "longitude": "-122.4194",
+        "location": {"latitude": "37.7749", "longitude": "-122.4194"}
+    },
+    {
+        "applicant": "Primo Pizza",
+        "fooditems": "Pizza: Calzones",
+        "facilitytype": "Truck",
+        "status": "APPROVED",
+        "address": "2 Market St",
+        "latitude": "37.7937",
+        "longitude": "-122.3951",
+        "location": {"latitude": "37.7937", "longitude": "-122.3951"}
+    },
+    {
+        "applicant": "Curry Up Now",
+        "fooditems": "Curry: Rice",
+        "facilitytype": "Push Cart",
+        "status": "APPROVED",
+        "address": "Assessors Block",
+        "latitude": "0",
+        "longitude": "0"
+    }
+]
+
+
+def tokenize(text):
+    """
+    :return: the lowercased words of text, like the standard analyzer
+    :rtype: list
+    """
+    return re.findall(r"\w+", str(text).lower())
+
+
+def contains_phrase(text, phrase):
+    """
+    :return: whether the words of phrase appear next to each other in text, like match_phrase
+    :rtype: bool
+    """
+    words, phrase = tokenize(text), tokenize(phrase)
+    return any(words[i:i + len(phrase)] == phrase for i in range(len(words)))
+
+
+class StubElasticsearch(object):
+    """
+    Stands in for the elasticsearch client. A document matches a query when any word of the
+    query is one of the words of its fooditems and its filtered fields contain the filter
+    phrases.
+    :ivar fail: when set every call raises a connection error
+    :ivar delay: seconds every call takes before answering
+    :ivar calls: number of searches made
+    :ivar pings: number of pings made
+    """
+
+    def __init__(self, trucks):
+        self.trucks = list(trucks)
+        self.fail = False
+        self.delay = 0
+        self.calls = 0
+        self.pings = 0
+        self.indices = mock.Mock()
+        self.indices.exists.return_value = True
+
+    def _answer(self):
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise exceptions.ConnectionError("N/A", "stub elasticsearch is down")
+
+    def _hits(self, body):
+        query = body["query"]
+        filters = []
+        if "bool" in query:
+            filters = [f["match_phrase"] for f in query["bool"]["filter"]]
+            query = query["bool"]["must"]
+        words = tokenize(query["match"]["fooditems"])
+        hits = []
+        for truck in self.trucks:
+            if not set(words) & set(tokenize(truck["fooditems"])):
+                continue
+            if all(contains_phrase(truck.get(field, ""), value)
+                   for f in filters for field, value in f.items()):
+                hits.append({"_source": truck})
+        return {"hits": {"total": len(hits), "hits": hits}}
+
+    def search(self, index, body, **params):
+        self.calls += 1
+        self._answer()
+        return self._hits(body)
+
+    def msearch(self, body, **params):
+        self.calls += 1
+        self._answer()
+        return {"responses": [self._hits(b) for b in body[1::2]]}
+
+    def ping(self, **params):
+        # the client reports a failed ping instead of raising
+        self.pings += 1
+        try:
+            self._answer()
+        except exceptions.ConnectionError:
+            return False
+        return True
+
+
+class CibusCartTestCase(unittest.TestCase):
+    """
+    Creates a testing application backed by a stub elasticsearch holding TRUCKS
+    """
+
+    def setUp(self):
+        self.es = StubElasticsearch(TRUCKS)
+        for patcher in (mock.patch.object(models, "es", self.es),
+                        mock.patch.object(models.helpers, "scan", self.scan)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.app = create_app("testing")
+        self.client = self.app.test_client()
+        result_cache.clear()
+
+    def scan(self, es, index):
+        return ({"_source": truck} for truck in es.trucks)
+
+    def get_json(self, url, **kwargs):
+        """
+        :return: the response to a GET request and its decoded JSON body
+        """
+        response = self.client.get(url, **kwargs)
+        return response, json.loads(response.data.decode("utf-8"))
+
+    def post_json(self, url, payload, **kwargs):
+        """
+        :return: the response to a POST request sending payload as JSON and its decoded body
+        """
+        response = self.client.post(url, data=json.dumps(payload),
+                                    content_type="application/json", **kwargs)
+        return response, json.loads(response.data.decode("utf-8"))
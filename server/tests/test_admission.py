@@ -0,0 +1,131 @@
+import threading
+import time
+import unittest
+
+from app.admission import AdmissionController, BackendOverloaded, TokenBucket
+from tests.base import CibusCartTestCase
+
+
+class TokenBucketTestCase(unittest.TestCase):
+
+    def test_bucket_refills_over_time(self):
+        bucket = TokenBucket(rate=20, capacity=2)
+        self.assertTrue(bucket.consume())
+        self.assertTrue(bucket.consume())
+        self.assertFalse(bucket.consume())
+        self.assertGreater(bucket.retry_after(), 0)
+        time.sleep(0.06)
+        self.assertTrue(bucket.consume())
+
+
+class AdmissionControllerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.admission = AdmissionController(rate=0.001, burst=2, max_in_flight=1,
+                                             queue_timeout=0.05, latency_target=0.5,
+                                             api_keys=["partner"])
+
+    def test_clients_have_their_own_bucket(self):
+        self.assertIsNone(self.admission.allow("ip:1", cost=2))
+        self.assertIsNotNone(self.admission.allow("ip:1"))
+        self.assertIsNone(self.admission.allow("ip:2"))
+
+    def test_only_known_api_keys_identify_a_client(self):
+        self.assertEqual(self.admission.identify("1.2.3.4", "partner"), "key:partner")
+        self.assertEqual(self.admission.identify("1.2.3.4", "made-up"), "ip:1.2.3.4")
+        self.assertEqual(self.admission.identify("1.2.3.4"), "ip:1.2.3.4")
+
+    def test_backend_slot_waits_until_the_queue_deadline(self):
+        with self.admission.backend_slot():
+            started = time.time()
+            with self.assertRaises(BackendOverloaded):
+                with self.admission.backend_slot():
+                    pass
+            self.assertGreaterEqual(time.time() - started, 0.04)
+
+    def test_backend_slot_is_freed_for_waiting_calls(self):
+        entered = threading.Event()
+
+        def hold_slot():
+            with self.admission.backend_slot():
+                entered.set()
+                time.sleep(0.01)
+
+        worker = threading.Thread(target=hold_slot)
+        worker.start()
+        entered.wait()
+        with self.admission.backend_slot():
+            pass
+        worker.join()
+
+    def test_latency_is_tracked_per_query(self):
+        with self.admission.backend_slot(size=50):
+            time.sleep(0.05)
+        self.assertLess(self.admission.latency, 0.01)
+        self.assertFalse(self.admission.shedding)
+
+    def test_slow_backend_is_shed_without_queueing(self):
+        self.admission.latency = 1.0
+        self.assertTrue(self.admission.shedding)
+        with self.admission.backend_slot():
+            started = time.time()
+            with self.assertRaises(BackendOverloaded):
+                with self.admission.backend_slot():
+                    pass
+            self.assertLess(time.time() - started, 0.04)
+
+
+class RateLimitedSearchTestCase(CibusCartTestCase):
+
+    def setUp(self):
+        super(RateLimitedSearchTestCase, self).setUp()
+        self.app.admission.rate = 0.001
+        self.app.admission.burst = 2
+
+    def test_limited_client_gets_cached_results_or_429(self):
+        self.get_json("/search?q=tacos")
+        self.get_json("/search?q=curry")
+        response, body = self.get_json("/search?q=tacos")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body["hits"], 2)
+        response, body = self.get_json("/search?q=pizza")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response.headers)
+
+    def test_limited_batch_gets_cached_queries(self):
+        self.post_json("/search/batch", {"queries": ["tacos", "curry"]})
+        calls = self.es.calls
+        response, body = self.post_json("/search/batch", {"queries": ["tacos", "curry"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["status"] for r in body["results"]], ["success", "success"])
+        response, body = self.post_json("/search/batch", {"queries": ["tacos", "pizza"]})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual([r["status"] for r in body["results"]], ["success", "failure"])
+        self.assertEqual(self.es.calls, calls)
+
+    def test_batches_are_charged_for_cache_misses_only(self):
+        self.get_json("/search?q=tacos")
+        for _ in range(3):
+            response, body = self.post_json("/search/batch", {"queries": ["tacos", "Tacos"]})
+            self.assertEqual(response.status_code, 200)
+        response, body = self.get_json("/search?q=curry")
+        self.assertEqual(response.status_code, 200)
+
+    def test_oversized_batches_are_not_charged(self):
+        self.app.config["SEARCH_BATCH_MAX_QUERIES"] = 2
+        response, body = self.post_json("/search/batch", {"queries": ["a", "b", "c"]})
+        self.assertEqual(body["status"], "failure")
+        response, body = self.get_json("/search?q=tacos")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body["hits"], 2)
+
+    def test_unknown_api_keys_share_the_ip_bucket(self):
+        for key in ("a", "b"):
+            self.get_json("/search?q=tacos{}".format(key), headers={"X-Api-Key": key})
+        response, body = self.get_json("/search?q=pizza", headers={"X-Api-Key": "c"})
+        self.assertEqual(response.status_code, 429)
+
+    def test_facets_are_not_rate_limited(self):
+        for _ in range(4):
+            response, body = self.get_json("/search/facets")
+            self.assertEqual(response.status_code, 200)
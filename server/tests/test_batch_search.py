@@ -0,0 +1,51 @@
+from app.models import CibusElasticSearch
+from tests.base import CibusCartTestCase
+
+
+class BatchSearchTestCase(CibusCartTestCase):
+
+    def test_batch_runs_one_multi_search(self):
+        response, body = self.post_json("/search/batch", {"queries": [
+            "tacos", {"q": "curry"}, {"q": "tacos", "filters": {"status": "requested"}}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.es.calls, 1)
+        hits = [(r["q"], r["status"], r["hits"], r["locations"]) for r in body["results"]]
+        self.assertEqual(hits, [("tacos", "success", 2, 3),
+                                ("curry", "success", 1, 0),
+                                ("tacos", "success", 1, 1)])
+
+    def test_known_queries_are_served_from_cache(self):
+        self.get_json("/search?q=tacos")
+        calls = self.es.calls
+        response, body = self.post_json("/search/batch", {"queries": ["tacos", "Tacos"]})
+        self.assertEqual(self.es.calls, calls)
+        self.assertEqual([r["hits"] for r in body["results"]], [2, 2])
+
+    def test_invalid_queries_are_reported(self):
+        response, body = self.post_json("/search/batch", {"queries": [
+            {"q": 5}, ["tacos"], {"q": " "}, {"q": "tacos", "filters": {"secret": "x"}},
+            "curry"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["status"] for r in body["results"]],
+                         ["failure"] * 4 + ["success"])
+
+    def test_payload_must_be_an_object_with_queries(self):
+        for payload in (["tacos"], {"queries": "tacos"}, {"queries": []}, "tacos"):
+            response, body = self.post_json("/search/batch", payload)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(body["status"], "failure")
+
+    def test_batch_size_is_limited(self):
+        self.app.config["SEARCH_BATCH_MAX_QUERIES"] = 2
+        response, body = self.post_json("/search/batch", {"queries": ["a", "b", "c"]})
+        self.assertEqual(body["status"], "failure")
+        self.assertEqual(self.es.calls, 0)
+
+    def test_filters_keep_only_the_filtered_phrase(self):
+        body = CibusElasticSearch.build_query("pizza", {"applicant": "El Primo"})
+        self.assertEqual(body["query"]["bool"]["filter"],
+                         [{"match_phrase": {"applicant": "El Primo"}}])
+        response, body = self.post_json("/search/batch", {"queries": [
+            {"q": "pizza", "filters": {"applicant": "El Primo"}},
+            {"q": "pizza", "filters": {"applicant": "primo pizza"}}]})
+        self.assertEqual([r["hits"] for r in body["results"]], [0, 1])
@@ -0,0 +1,152 @@
+import threading
+import time
+import unittest
+
+from app.circuitbreaker import CircuitBreaker, CircuitOpen
+from app.mod_search import result_cache
+from app.mod_search.views import backend_call
+from tests.base import CibusCartTestCase
+
+
+def wait_for(condition, timeout=1.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.healthy = False
+        self.breaker = CircuitBreaker(failure_threshold=2, latency_threshold=0.05,
+                                      reset_timeout=0.02, probe=lambda: self.healthy)
+
+    def fail(self):
+        raise IOError("backend down")
+
+    def test_success_resets_the_failure_count(self):
+        with self.assertRaises(IOError):
+            self.breaker.call(self.fail)
+        self.assertEqual(self.breaker.call(lambda: 1), 1)
+        with self.assertRaises(IOError):
+            self.breaker.call(self.fail)
+        self.assertTrue(self.breaker.closed)
+
+    def test_latency_threshold_scales_with_the_number_of_queries(self):
+        for _ in range(2):
+            self.breaker.call(time.sleep, 0.06, size=2)
+        self.assertTrue(self.breaker.closed)
+        for _ in range(2):
+            self.breaker.call(time.sleep, 0.06)
+        self.assertFalse(self.breaker.closed)
+
+    def test_failed_probe_keeps_the_breaker_open(self):
+        for _ in range(2):
+            with self.assertRaises(IOError):
+                self.breaker.call(self.fail)
+        time.sleep(0.1)
+        self.assertFalse(self.breaker.closed)
+        with self.assertRaises(CircuitOpen):
+            self.breaker.call(lambda: 1)
+        self.healthy = True
+        self.assertTrue(wait_for(lambda: self.breaker.closed))
+
+
+class SearchCircuitBreakerTestCase(CibusCartTestCase):
+
+    def setUp(self):
+        super(SearchCircuitBreakerTestCase, self).setUp()
+        self.addCleanup(self.recover)
+
+    def recover(self):
+        # let the probe close the breaker so it stops before the stub is unpatched
+        self.es.fail = False
+        self.es.delay = 0
+        wait_for(lambda: self.app.breaker.closed)
+
+    def trip(self):
+        for i in range(self.app.config["BREAKER_FAILURE_THRESHOLD"]):
+            response, body = self.get_json("/search?q=trip{}".format(i))
+            self.assertEqual(body["msg"], "error in reaching elasticsearch")
+
+    def test_breaker_opens_after_failures(self):
+        self.es.fail = True
+        self.trip()
+        self.assertFalse(self.app.breaker.closed)
+
+    def test_breaker_opens_after_slow_calls(self):
+        self.es.delay = self.app.config["BREAKER_LATENCY_THRESHOLD"] + 0.05
+        for q in ("tacos", "curry"):
+            response, body = self.get_json("/search?q=" + q)
+            self.assertEqual(body["status"], "success")
+        self.assertFalse(self.app.breaker.closed)
+
+    def test_large_batches_do_not_open_the_breaker(self):
+        self.es.delay = self.app.config["BREAKER_LATENCY_THRESHOLD"] * 2
+        for i in range(self.app.config["BREAKER_FAILURE_THRESHOLD"]):
+            queries = ["item{}{}".format(i, j) for j in range(4)]
+            response, body = self.post_json("/search/batch", {"queries": queries})
+            self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.app.breaker.closed)
+
+    def test_open_breaker_answers_without_waiting_for_elasticsearch(self):
+        self.es.fail = True
+        self.trip()
+        self.es.delay = self.app.config["SEARCH_TIMEOUT"]
+        calls = self.es.calls
+        started = time.time()
+        response, body = self.get_json("/search?q=pizza")
+        self.assertEqual(response.status_code, 503)
+        self.assertLess(time.time() - started, self.app.config["SEARCH_TIMEOUT"] / 2)
+        self.assertEqual(self.es.calls, calls)
+
+    def test_open_breaker_serves_last_known_good_results(self):
+        self.get_json("/search?q=tacos")
+        result_cache.configure(max_size=512, ttl=0, stale_ttl=60)
+        self.es.fail = True
+        self.trip()
+        calls = self.es.calls
+        response, body = self.get_json("/search?q=tacos")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body["stale"])
+        self.assertEqual(body["hits"], 2)
+        self.assertEqual(self.es.calls, calls)
+
+    def test_stale_entry_is_served_while_it_is_refreshed(self):
+        self.get_json("/search?q=curry")
+        result_cache.configure(max_size=512, ttl=0, stale_ttl=60)
+        del self.es.trucks[-1]
+        response, body = self.get_json("/search?q=curry")
+        self.assertTrue(body["stale"])
+        self.assertEqual(body["hits"], 1)
+        key = result_cache.make_key("curry")
+        self.assertTrue(wait_for(lambda: result_cache.lookup(key)[0]["hits"] == 0))
+
+    def test_half_open_probe_closes_the_breaker(self):
+        self.es.fail = True
+        self.trip()
+        self.assertTrue(wait_for(lambda: self.es.pings > 0))
+        self.assertFalse(self.app.breaker.closed)
+        self.es.fail = False
+        self.assertTrue(wait_for(lambda: self.app.breaker.closed))
+        response, body = self.get_json("/search?q=tacos")
+        self.assertEqual(body["hits"], 2)
+
+    def test_queueing_for_a_slot_is_not_counted_as_latency(self):
+        self.app.admission.max_in_flight = 1
+        holding = threading.Event()
+
+        def hold_slot():
+            with self.app.admission.backend_slot():
+                holding.set()
+                time.sleep(self.app.config["BREAKER_LATENCY_THRESHOLD"] * 1.5)
+
+        worker = threading.Thread(target=hold_slot)
+        worker.start()
+        holding.wait()
+        self.assertEqual(backend_call(self.app, lambda: 1), 1)
+        self.assertEqual(self.app.breaker.failures, 0)
+        worker.join()
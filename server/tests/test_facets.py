@@ -0,0 +1,79 @@
+import unittest
+
+from app.facets import FacetIndex, geohash, truck_coordinates
+from app.models import CibusElasticSearch, facet_index, format_fooditems
+from app.mod_search import result_cache
+from tests.base import CibusCartTestCase, TRUCKS
+
+
+class GeohashTestCase(unittest.TestCase):
+
+    def test_geohash(self):
+        self.assertEqual(geohash(37.7749, -122.4194), "9q8yyk")
+        self.assertEqual(geohash(37.7749, -122.4194, precision=4), "9q8y")
+
+    def test_truck_coordinates(self):
+        self.assertEqual(truck_coordinates({"location": {"latitude": "1.5", "longitude": "2"}}),
+                         (1.5, 2.0))
+        self.assertEqual(truck_coordinates({"latitude": "1.5", "longitude": "2"}), (1.5, 2.0))
+        self.assertIsNone(truck_coordinates({"latitude": "0", "longitude": "0"}))
+        self.assertIsNone(truck_coordinates({"address": "Assessors Block"}))
+
+
+class FacetIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.facets = FacetIndex(precision=5)
+        self.facets.refresh(TRUCKS, format_fooditems)
+
+    def test_counts_are_precomputed(self):
+        summary = self.facets.summary()
+        self.assertEqual(summary["generation"], 1)
+        self.assertEqual(summary["categories"][:3], [
+            {"name": "burritos", "count": 2},
+            {"name": "quesadillas", "count": 2},
+            {"name": "tacos", "count": 2}])
+        self.assertEqual(summary["vendors"][0], {"name": "Tacos El Primo", "count": 2})
+        self.assertEqual(sum(c["count"] for c in summary["cells"]), 4)
+        self.assertEqual(len(self.facets.summary(limit=1)["categories"]), 1)
+
+    def test_multi_word_queries_match_each_word(self):
+        names = [c["name"] for c in self.facets.matching_categories("Fish, curry")["categories"]]
+        self.assertEqual(sorted(names), ["curry", "fish tacos"])
+
+    def test_short_words_and_inner_substrings_do_not_match(self):
+        facets = FacetIndex()
+        facets.refresh([{"fooditems": "Rice: Licorice: Hot Dogs"}], format_fooditems)
+        names = [c["name"] for c in facets.matching_categories("a rice de")["categories"]]
+        self.assertEqual(names, ["rice"])
+        self.assertEqual(facets.matching_categories("a i de")["categories"], [])
+        names = [c["name"] for c in facets.matching_categories("dog")["categories"]]
+        self.assertEqual(names, ["hot dogs"])
+
+    def test_refresh_starts_a_new_generation_and_notifies(self):
+        notified = []
+        self.facets.subscribe(lambda: notified.append(True))
+        self.assertEqual(self.facets.refresh(TRUCKS[:1], format_fooditems).generation, 2)
+        self.assertEqual(notified, [True])
+
+
+class FacetsViewTestCase(CibusCartTestCase):
+
+    def test_facets_endpoint(self):
+        response, body = self.get_json("/search/facets?limit=1")
+        self.assertEqual(body["status"], "success")
+        self.assertEqual(body["categories"], [{"name": "burritos", "count": 2}])
+        self.assertEqual(self.es.calls, 0)
+
+    def test_facets_are_embedded_in_searches(self):
+        response, body = self.get_json("/search?q=fish tacos")
+        self.assertEqual(body["facets"]["generation"], facet_index.snapshot.generation)
+        self.assertEqual([c["name"] for c in body["facets"]["categories"]],
+                         ["tacos", "fish tacos"])
+
+    def test_new_index_generation_clears_cached_results(self):
+        self.get_json("/search?q=tacos")
+        key = result_cache.make_key("tacos")
+        self.assertIsNotNone(result_cache.lookup(key)[0])
+        CibusElasticSearch().check_and_load_index()
+        self.assertIsNone(result_cache.lookup(key)[0])
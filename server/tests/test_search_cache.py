@@ -0,0 +1,37 @@
+import time
+import unittest
+
+from app.mod_search.cache import SearchResultCache
+
+
+class SearchResultCacheTestCase(unittest.TestCase):
+
+    def test_keys_ignore_case_and_filter_order(self):
+        self.assertEqual(
+            SearchResultCache.make_key(" Tacos", {"status": "APPROVED", "facilitytype": "Truck"}),
+            SearchResultCache.make_key("tacos ", {"facilitytype": "truck", "status": "approved"}))
+
+    def test_lookup_reports_freshness(self):
+        cache = SearchResultCache(ttl=0.05, stale_ttl=0.1)
+        cache.set("tacos", 1)
+        self.assertEqual(cache.lookup("tacos"), (1, True))
+        time.sleep(0.07)
+        self.assertEqual(cache.lookup("tacos"), (1, False))
+        time.sleep(0.1)
+        self.assertEqual(cache.lookup("tacos"), (None, False))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = SearchResultCache(max_size=2)
+        cache.set("tacos", 1)
+        cache.set("curry", 2)
+        cache.lookup("tacos")
+        cache.set("pizza", 3)
+        self.assertEqual(cache.lookup("curry"), (None, False))
+        self.assertEqual(cache.lookup("tacos"), (1, True))
+
+    def test_one_revalidation_per_entry(self):
+        cache = SearchResultCache()
+        self.assertTrue(cache.begin_revalidate("tacos"))
+        self.assertFalse(cache.begin_revalidate("tacos"))
+        cache.end_revalidate("tacos")
+        self.assertTrue(cache.begin_revalidate("tacos"))